@@ -0,0 +1,88 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Native encoder for AFG2125 arbitrary waveform data. Build in place with
+
+    cythonize -i _gwinstek_native.pyx
+
+gwinstek falls back to NumPy when this module is not compiled
+"""
+from cpython.bytes cimport PyBytes_FromStringAndSize
+from libc.math cimport fabs, isfinite, nearbyint
+from libc.stdlib cimport malloc, free
+
+import numpy as np
+
+
+cdef double _maxabs(const double* p, Py_ssize_t n) noexcept nogil:
+    cdef double m = 0.0, a
+    cdef Py_ssize_t i
+    for i in range(n):
+        a = fabs(p[i])
+        if a > m or a != a:  # Keep a NaN once seen
+            m = a
+    return m
+
+
+cdef Py_ssize_t _format_csv(const short* p, Py_ssize_t n, char* out) noexcept nogil:
+    # Samples are within +/-511, so at most three digits each
+    cdef Py_ssize_t pos = 0, i
+    cdef int v
+    for i in range(n):
+        if i:
+            out[pos] = b","
+            pos += 1
+        v = p[i]
+        if v < 0:
+            out[pos] = b"-"
+            pos += 1
+            v = -v
+        if v >= 100:
+            out[pos] = <char>(48 + v // 100)
+            out[pos + 1] = <char>(48 + v // 10 % 10)
+            out[pos + 2] = <char>(48 + v % 10)
+            pos += 3
+        elif v >= 10:
+            out[pos] = <char>(48 + v // 10)
+            out[pos + 1] = <char>(48 + v % 10)
+            pos += 2
+        else:
+            out[pos] = <char>(48 + v)
+            pos += 1
+    return pos
+
+
+def encode_arb(data) -> bytes:
+    """
+    Scales the waveform to +/-511, clamped, and returns the samples as comma
+    separated ASCII, matching the NumPy path in gwinstek
+    """
+    cdef const double[::1] arr = np.ascontiguousarray(data, dtype=np.float64).reshape(-1)
+    cdef Py_ssize_t n = arr.shape[0], i, length
+    cdef short* scaled
+    cdef char* out
+    cdef double m, scale, v
+
+    if n == 0:
+        return b""
+    scaled = <short*>malloc(n * sizeof(short))
+    out = <char*>malloc(n * 5)
+    if scaled == NULL or out == NULL:
+        free(scaled)
+        free(out)
+        raise MemoryError()
+
+    try:
+        with nogil:
+            m = _maxabs(&arr[0], n)
+        if not isfinite(m):
+            raise ValueError("waveform data contains NaN or infinite values")
+        with nogil:
+            scale = 511.0 / m if m != 0 else 0.0
+            for i in range(n):
+                v = nearbyint(arr[i] * scale)
+                scaled[i] = <short>(-511.0 if v < -511.0 else (511.0 if v > 511.0 else v))
+            length = _format_csv(scaled, n, out)
+        return PyBytes_FromStringAndSize(out, length)
+    finally:
+        free(scaled)
+        free(out)
@@ -1,30 +1,351 @@
-from pyvisa import ResourceManager, Resource
-from typing import Literal
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, AsyncIterator, Literal
+import asyncio
+import contextlib
+import functools
+import io
 import logging
+import numpy as np
+import os
+import threading
+
+if TYPE_CHECKING:
+    from pyvisa import ResourceManager, Resource
+
+
+_LOG_PAYLOAD_LIMIT = 120
+
+# Replies to queries are short numbers or *IDN? strings
+_ASYNC_READ_SIZE = 256
+
+# Shared by every instrument opened without an explicit resource manager. Opening
+# resources from several threads is as safe as the VISA backend in use
+_DEFAULT_RM: ResourceManager | None = None
+_DEFAULT_RM_LOCK = threading.Lock()
+
+_UNRESOLVED = object()
+_encode_arb = _UNRESOLVED
+_scale_kernel = _UNRESOLVED
+
+_CMD_RST = b"*RST"
+_CMD_CLS = b"*CLS"
+_PFX_SAV = b"*SAV "
+_CMD_OPC = b"*OPC?"
+_PFX_RCL = b"*RCL "
+_PFX_FREQ = b"SOUR:FREQ "
+_PFX_AMPL = b"SOUR:AMPL "
+_PFX_DCO = b"SOUR:DCO "
+_PFX_DCYC = b"SOUR:SQU:DCYC "
+_PFX_SYMM = b"SOUR:RAMP:SYMM "
+
+
+def _scale_to_dac(data, out):
+    """
+    Finds the peak magnitude and writes the scaled int16 samples to out,
+    returning the peak. The input is only read from memory once
+    """
+    max_val = 0.0
+    for v in data:
+        a = abs(v)
+        if a > max_val or a != a:  # Keep a NaN once seen
+            max_val = a
+    if not np.isfinite(max_val):
+        raise ValueError("waveform data contains NaN or infinite values")
+    if max_val == 0.0:
+        out[:] = 0
+        return max_val
+    scale = 511.0 / max_val
+    for i in range(data.size):
+        v = round(data[i] * scale)
+        out[i] = np.int16(-511 if v < -511 else (511 if v > 511 else v))
+    return max_val
+
+
+def _numba_kernel():
+    """
+    Returns _scale_to_dac compiled with numba when GWINSTEK_NUMBA=1 is set and
+    numba is installed, otherwise None. Importing and compiling takes a few
+    hundred ms, which only pays off for scripts that upload many waveforms
+    """
+    global _scale_kernel
+    if _scale_kernel is _UNRESOLVED:
+        _scale_kernel = None
+        if os.environ.get("GWINSTEK_NUMBA") == "1":
+            try:
+                from numba import njit
+            except ImportError:
+                pass
+            else:
+                _scale_kernel = njit(cache=True)(_scale_to_dac)
+    return _scale_kernel
+
+
+def _native_encoder():
+    """
+    Returns the compiled encode_arb function, or None when the optional
+    _gwinstek_native extension has not been built. Imported on first use
+    """
+    global _encode_arb
+    if _encode_arb is _UNRESOLVED:
+        try:
+            from ._gwinstek_native import encode_arb
+        except ImportError:
+            try:
+                from _gwinstek_native import encode_arb
+            except ImportError:
+                encode_arb = None
+        _encode_arb = encode_arb
+    return _encode_arb
+
+
+def _default_resource_manager() -> ResourceManager:
+    global _DEFAULT_RM
+    with _DEFAULT_RM_LOCK:
+        if _DEFAULT_RM is None:
+            from pyvisa import ResourceManager
+            _DEFAULT_RM = ResourceManager()
+        return _DEFAULT_RM
+
+
+def _cached(key: str):
+    """
+    Serves a getter from the instrument's settings cache, querying and storing
+    the value on a miss. Works for both plain and async getters
+    """
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            async def wrapper(self):
+                if key not in self._cache:
+                    self._cache[key] = await func(self)
+                return self._cache[key]
+        else:
+            def wrapper(self):
+                with self._lock:
+                    if key not in self._cache:
+                        self._cache[key] = func(self)
+                    return self._cache[key]
+        return functools.wraps(func)(wrapper)
+    return decorator
+
+
+class _BatchCtx:
+    """
+    Buffers the writes of an instrument and flushes them as one message on exit
+    """
+    def __init__(self, instrument: "AFG2125"):
+        self._instrument = instrument
+        self._outer = False
+
+    def __enter__(self) -> "AFG2125":
+        with self._instrument._lock:
+            if self._instrument._batch is None:
+                self._instrument._batch = []
+                self._outer = True
+        return self._instrument
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if not self._outer:
+            return
+        with self._instrument._lock:
+            try:
+                if exc_type is None:
+                    self._instrument._flush()
+                else:
+                    # Setters already cached values that are now never sent
+                    self._instrument.invalidate_cache()
+            finally:
+                self._instrument._batch = None
 
 
 class AFG2125:
-    def __init__(self, resource_name: str, resource_manager = None):
+    def __init__(
+        self,
+        resource_name: str,
+        resource_manager = None,
+        timeout: int = 5000,
+        baud_rate: int | None = None,
+    ):
+        """
+        Opens the instrument. Terminators, chunk size and the timeout in ms are
+        configured once here, large enough for a full DAC upload to be written in
+        a single chunk. The baud rate is only set for serial (ASRL) resources when
+        given, otherwise the port keeps its current setting
+        """
         self.logger = logging.getLogger(self.__class__.__name__)
+        self._batch: list[str] | None = None
+        self._scratch_f64: np.ndarray | None = None
+        self._scratch_i16: np.ndarray | None = None
+        self._io_pool: ThreadPoolExecutor | None = None
+        self._cache: dict[str, float] = {}
+        # Guards the resource, the batch and the cache, which the async worker
+        # thread shares with synchronous callers
+        self._lock = threading.RLock()
         if resource_manager is None:
-            self._rm = ResourceManager()
+            self._rm = _default_resource_manager()
         else:
             self._rm = resource_manager
 
-        self._resource: Resource = self._rm.open_resource(resource_name)
+        options = dict(
+            write_termination="\n",
+            read_termination="\n",
+            chunk_size=1 << 16,
+            timeout=timeout,
+        )
+        if baud_rate is not None and resource_name.upper().startswith("ASRL"):
+            options["baud_rate"] = baud_rate
+        self._resource: Resource = self._rm.open_resource(resource_name, **options)
 
     def close(self) -> None:
+        if self._io_pool is not None:
+            self._io_pool.shutdown()
+            self._io_pool = None
         self._resource.close()
 
+    def invalidate_cache(self) -> None:
+        """
+        Discards cached settings so the next getters query the instrument.
+        set_frequency, set_amplitude and set_offset cache the value they write
+        without checking that the instrument accepted it unchanged, and commands
+        sent directly with write or write_async bypass the cache. Call this after
+        such commands, after a setter whose value may have been clamped or
+        rejected, or after the settings were changed from the front panel
+        """
+        with self._lock:
+            self._cache.clear()
+
+    def _update_cache(self, key: str, value: float | str) -> None:
+        # Keywords such as MIN resolve on the instrument, so query them next time
+        with self._lock:
+            if isinstance(value, str):
+                self._cache.pop(key, None)
+            else:
+                self._cache[key] = float(value)
+
+    def batched(self) -> _BatchCtx:
+        """
+        Returns a context manager that buffers writes and sends them as a single
+        chained message when the block exits. Queries flush the buffer first
+        """
+        return _BatchCtx(self)
+
+    def _log_sent(self, command: str | bytes) -> None:
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        if len(command) > _LOG_PAYLOAD_LIMIT:
+            self.logger.debug(">>> %s...<%d bytes>", command[:_LOG_PAYLOAD_LIMIT], len(command))
+        else:
+            self.logger.debug(">>> %s", command)
+
+    def _flush(self) -> None:
+        with self._lock:
+            if not self._batch:
+                return
+            command = ";:".join(self._batch)
+            self._batch.clear()
+            self._log_sent(command)
+            try:
+                self._resource.write_raw(
+                    (command + self._resource.write_termination).encode(self._resource.encoding)
+                )
+            except Exception:
+                self.invalidate_cache()
+                raise
+
     def query(self, command: str) -> str:
-        self.logger.debug(f">>> {command}")
-        response = self._resource.query(command).strip()
-        self.logger.debug(f"<<< {response}")
-        return response
+        with self._lock:
+            self._flush()
+            self._log_sent(command)
+            response = self._resource.query(command).strip()
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("<<< %s", response)
+            return response
 
     def write(self, command: str) -> None:
-        self.logger.debug(f">>> {command}")
-        self._resource.write(command)
+        with self._lock:
+            if self._batch is not None:
+                self._batch.append(command)
+                return
+            self._log_sent(command)
+            self._resource.write(command)
+
+    def _run_in_pool(self, func, *args) -> asyncio.Future:
+        # One worker per instrument keeps its transactions in order while the
+        # VISA library releases the GIL, so several instruments run in parallel
+        if self._io_pool is None:
+            self._io_pool = ThreadPoolExecutor(max_workers=1)
+        return asyncio.get_running_loop().run_in_executor(self._io_pool, func, *args)
+
+    async def query_async(self, command: str) -> str:
+        """
+        Awaitable version of query that runs the transaction in a worker thread.
+        Queries to several instruments can overlap, e.g.
+
+        await asyncio.gather(afg1.get_frequency_async(), afg2.get_frequency_async())
+
+        Each transaction holds the instrument's lock, but the order between
+        synchronous and async calls on one instrument is not defined, so do not
+        mix them, or use batched(), while async calls are in flight
+        """
+        return await self._run_in_pool(self.query, command)
+
+    async def write_async(self, command: str) -> None:
+        """
+        Awaitable version of write that runs the transaction in a worker thread.
+        See query_async about mixing synchronous and async calls
+        """
+        await self._run_in_pool(self.write, command)
+
+    def _write_bytes(self, command: bytes) -> None:
+        """
+        Writes an already encoded command followed by the write termination.
+        Unlike pyvisa's write_raw, the terminator is added here
+        """
+        with self._lock:
+            if self._batch is not None:
+                self._batch.append(command.decode())
+                return
+            self._log_sent(command)
+            self._resource.write_raw(command + self._resource.write_termination.encode())
+
+    def _query_bytes(self, command: bytes) -> str:
+        """
+        Writes an already encoded command followed by the write termination and
+        returns the response. Any batched writes are flushed first
+        """
+        with self._lock:
+            self._flush()
+            self._log_sent(command)
+            self._resource.write_raw(command + self._resource.write_termination.encode())
+            response = self._resource.read().strip()
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("<<< %s", response)
+            return response
+
+    def _write_float(self, prefix: bytes, value: float | str) -> None:
+        """
+        Writes a command prefix followed by a numeric value or a keyword such as MIN
+        """
+        if isinstance(value, str):
+            self._write_bytes(prefix + value.encode())
+        elif isinstance(value, np.generic):
+            # str() keeps the shortest repr of the value's own precision, so
+            # float32 0.1 is sent as 0.1 rather than widened to float64
+            self._write_bytes(prefix + str(value).encode())
+        else:
+            self._write_bytes(prefix + b"%.15g" % float(value))
+
+    def _write_many(self, commands: list[str], sequential: bool = False) -> None:
+        """
+        Writes several commands chained into a single message. Instruments that
+        reject chained commands can use sequential=True to send one per write
+        """
+        if sequential:
+            for command in commands:
+                self.write(command)
+        else:
+            self.write(";:".join(commands))
 
     def identify(self) -> str:
         """
@@ -39,26 +360,28 @@ class AFG2125:
         """
         Resets the instrument to its factory default state
         """
-        self.write("*RST")
+        self._write_bytes(_CMD_RST)
+        self.invalidate_cache()
 
     def clear(self) -> None:
         """
         Clears all the event registers, the error queue, and cancels
         and *OPC command
         """
-        self.write("*CLS")
+        self._write_bytes(_CMD_CLS)
 
     def save(self, slot: int) -> None:
         """
         Saves a configuration or user-defined waveform to the given slot
         """
-        self.write(f"*SAV {slot}")
+        self._write_bytes(_PFX_SAV + str(slot).encode())
 
     def recall(self, slot: int) -> None:
         """
         Recalls a configuration or user-defined waveform from the given slot
         """
-        self.write(f"*RCL {slot}")
+        self._write_bytes(_PFX_RCL + str(slot).encode())
+        self.invalidate_cache()
 
     def apply(
         self, 
@@ -70,14 +393,15 @@ class AFG2125:
         """
         Configures basic waveform parameters an immediately enable output
         """
-        command = f"SOUR:APPL:{function}"
+        parts = [f"SOUR:APPL:{function}"]
         if frequency is not None:
-            command += f" {frequency}"
-        if all(param is not None for param in [frequency, amplitude]):
-            command += f",{amplitude}"
-        if all(param is not None for param in [frequency, amplitude, offset]):
-            command += f",{offset}"
-        self.write(command)
+            parts.append(f" {frequency}")
+            if amplitude is not None:
+                parts.append(f",{amplitude}")
+                if offset is not None:
+                    parts.append(f",{offset}")
+        self.write("".join(parts))
+        self.invalidate_cache()
 
     def set_function(self, function: Literal["SIN", "SQU", "RAMP", "NOIS", "USER"]) -> None:
         """
@@ -86,6 +410,7 @@ class AFG2125:
         are used automatically
         """
         self.write(f"SOUR:FUNC {function}")
+        self.invalidate_cache()
 
     def get_function(self) -> Literal["SIN", "SQU", "RAMP", "NOIS", "USER"]:
         """
@@ -96,47 +421,78 @@ class AFG2125:
     def set_frequency(self, frequency: Literal["MIN", "MAX"] | float | str):
         """
         Sets the output frequency in Hz. The maximum and minimum frequency depends
-        on the function mode
+        on the function mode. The value is cached as requested without confirming
+        the instrument accepted it, see invalidate_cache
         """
-        self.write(f"SOUR:FREQ {frequency}")
+        self._write_float(_PFX_FREQ, frequency)
+        self._update_cache("freq", frequency)
 
+    @_cached("freq")
     def get_frequency(self) -> float:
         """
         Returns the current output frequency setting in Hz
         """
         return float(self.query("SOUR:FREQ?"))
+
+    @_cached("freq")
+    async def get_frequency_async(self) -> float:
+        """
+        Awaitable version of get_frequency
+        """
+        return float(await self.query_async("SOUR:FREQ?"))
     
     def set_amplitude(self, amplitude: Literal["MIN", "MAX"] | float | str):
         """
         Sets the output amplitude. The maximum and minimum depends on the output
         termination. The default amplitude for all functions is 100 mVpp (50 ohm).
-        The unit depends on the SOURCE:VOLTAGE:UNIT setting
+        The unit depends on the SOURCE:VOLTAGE:UNIT setting. The value is cached
+        as requested without confirming the instrument accepted it, see
+        invalidate_cache
         """
-        self.write(f"SOUR:AMPL {amplitude}")
+        self._write_float(_PFX_AMPL, amplitude)
+        self._update_cache("ampl", amplitude)
 
+    @_cached("ampl")
     def get_amplitude(self) -> float:
         """
         Returns the current output amplitude setting
         """
         return float(self.query("SOUR:AMPL?"))
+
+    @_cached("ampl")
+    async def get_amplitude_async(self) -> float:
+        """
+        Awaitable version of get_amplitude
+        """
+        return float(await self.query_async("SOUR:AMPL?"))
     
     def set_offset(self, offset: Literal["MIN", "MAX"] | float | str):
         """
-        Sets the DC offset for the current mode
+        Sets the DC offset for the current mode. The value is cached as requested
+        without confirming the instrument accepted it, see invalidate_cache
         """
-        self.write(f"SOUR:DCO {offset}")
+        self._write_float(_PFX_DCO, offset)
+        self._update_cache("dco", offset)
 
+    @_cached("dco")
     def get_offset(self) -> float:
         """
         Returns the DC offset for the current mode 
         """
         return float(self.query("SOUR:DCO?"))
+
+    @_cached("dco")
+    async def get_offset_async(self) -> float:
+        """
+        Awaitable version of get_offset
+        """
+        return float(await self.query_async("SOUR:DCO?"))
     
     def set_duty_cycle(self, duty_cycle: Literal["MIN", "MAX"] | float):
         """
         Sets the duty cycle for square waves as a percentage
         """
-        self.write(f"SOUR:SQU:DCYC {duty_cycle}")
+        self._write_float(_PFX_DCYC, duty_cycle)
 
     def get_duty_cycle(self) -> float:
         """
@@ -148,7 +504,7 @@ class AFG2125:
         """
         Sets the symmetry for ramp waves as a percentage
         """
-        self.write(f"SOUR:RAMP:SYMM {symmetry}")
+        self._write_float(_PFX_SYMM, symmetry)
 
     def get_ramp_symmetry(self) -> float:
         """
@@ -173,6 +529,7 @@ class AFG2125:
         Sets the output termination load. The default output load is 50 ohm
         """
         self.write(f"OUTP:LOAD {load}")
+        self.invalidate_cache()
 
     def get_output_load(self) -> Literal["DEF", "INF"]:
         """
@@ -185,6 +542,7 @@ class AFG2125:
         Sets the output amplitude units
         """
         self.write(f"SOUR:VOLT:UNIT {unit}")
+        self.invalidate_cache()
 
     def get_voltage_unit(self) -> Literal["VPP", "VRMS", "DBM"]:
         """
@@ -199,21 +557,20 @@ class AFG2125:
         function: Literal["SIN", "SQU", "RAMP"] = "SIN",
         frequency: Literal["MIN", "MAX"] | float = 100.0,
         depth: Literal["MIN", "MAX"] | float = 100.0,
+        sequential: bool = False,
     ) -> None:
         """
         Configures amplitude modulation mode. Use the apply command to configure the 
         carrier waveform first
         """
-        self.write(f"SOUR:AM:STAT {state}")
-        if state == "OFF":
-            return
-        
-        self.write(f"SOUR:AM:SOUR {source}")
-        if source == "INT":
-            self.write(f"SOUR:AM:INT:FUNC {function}")
-            self.write(f"SOUR:AM:INT:FREQ {frequency}")
-
-        self.write(f"SOUR:AM:DEPT {depth}")
+        commands = [f"SOUR:AM:STAT {state}"]
+        if state == "ON":
+            commands.append(f"SOUR:AM:SOUR {source}")
+            if source == "INT":
+                commands.append(f"SOUR:AM:INT:FUNC {function}")
+                commands.append(f"SOUR:AM:INT:FREQ {frequency}")
+            commands.append(f"SOUR:AM:DEPT {depth}")
+        self._write_many(commands, sequential)
 
     def set_frequency_modulation(
         self,
@@ -222,21 +579,20 @@ class AFG2125:
         function: Literal["SIN", "SQU", "RAMP"] = "SIN",
         frequency: Literal["MIN", "MAX"] | float = 100.0,
         deviation: Literal["MIN", "MAX"] | float = 100.0,
+        sequential: bool = False,
     ) -> None:
         """
         Configures frequency modulation mode. Use the apply command to configure the 
         carrier waveform first
         """
-        self.write(f"SOUR:FM:STAT {state}")
-        if state == "OFF":
-            return
-        
-        self.write(f"SOUR:FM:SOUR {source}")
-        if source == "INT":
-            self.write(f"SOUR:FM:INT:FUNC {function}")
-            self.write(f"SOUR:FM:INT:FREQ {frequency}")
-
-        self.write(f"SOUR:FM:DEV {deviation}")
+        commands = [f"SOUR:FM:STAT {state}"]
+        if state == "ON":
+            commands.append(f"SOUR:FM:SOUR {source}")
+            if source == "INT":
+                commands.append(f"SOUR:FM:INT:FUNC {function}")
+                commands.append(f"SOUR:FM:INT:FREQ {frequency}")
+            commands.append(f"SOUR:FM:DEV {deviation}")
+        self._write_many(commands, sequential)
     
     def set_frequency_sweep(
         self,
@@ -246,33 +602,259 @@ class AFG2125:
         spacing: Literal["LIN", "LOG"] = "LIN",
         rate: Literal["MIN", "MAX"] | float = 1.0,
         source: Literal["IMM", "EXT"] = "IMM",
+        sequential: bool = False,
     ) -> None:
         """
         Configures frequency sweep mode. Use the apply command to configure the 
         base waveform first
         """
-        self.write(f"SOUR:SWE:STAT {state}")
-        if state == "OFF":
+        commands = [f"SOUR:SWE:STAT {state}"]
+        if state == "ON":
+            commands += [
+                f"SOUR:FREQ:STAR {start}",
+                f"SOUR:FREQ:STOP {stop}",
+                f"SOUR:SWE:SPAC {spacing}",
+                f"SOUR:SWE:RATE {rate}",
+                f"SOUR:SWE:SOUR {source}",
+            ]
+        self._write_many(commands, sequential)
+
+    def _quantize(self, data: np.ndarray | list) -> np.ndarray:
+        """
+        Scales the waveform to the DAC range and returns it as int16, clamped to
+        +/-511. The work is done in reusable scratch buffers, so the result is only
+        valid until the next call
+        """
+        if not (
+            isinstance(data, np.ndarray)
+            and data.dtype in (np.float32, np.float64)
+            and data.ndim == 1
+            and data.flags.c_contiguous
+        ):
+            data = np.ascontiguousarray(data, dtype=np.float64).reshape(-1)
+
+        if self._scratch_f64 is None:
+            self._scratch_f64 = np.empty(4096, dtype=np.float64)
+            self._scratch_i16 = np.empty(4096, dtype=np.int16)
+        scaled = self._scratch_i16[:data.size]
+
+        kernel = _numba_kernel()
+        if kernel is not None:
+            kernel(data, scaled)
+            return scaled
+
+        tmp = self._scratch_f64[:data.size]
+        max_val = np.abs(data, out=tmp).max()
+        if not np.isfinite(max_val):
+            raise ValueError("waveform data contains NaN or infinite values")
+        if max_val == 0:
+            scaled.fill(0)  # Avoid division by zero
+            return scaled
+        np.multiply(data, 511.0 / max_val, out=tmp)
+        np.rint(tmp, out=tmp)
+        np.copyto(scaled, tmp, casting="unsafe")
+        np.clip(scaled, -511, 511, out=scaled)
+        return scaled
+
+    def _encode_csv(self, data: np.ndarray | list) -> bytes:
+        """
+        Returns the scaled waveform as comma separated ASCII samples
+        """
+        encode_arb = _native_encoder()
+        if encode_arb is not None:
+            return encode_arb(data)
+
+        buf = io.BytesIO()
+        np.savetxt(buf, self._quantize(data).reshape(1, -1), fmt="%d", delimiter=",")
+        return buf.getvalue().rstrip()
+
+    def set_arb_data(
+        self,
+        data: np.ndarray | list,
+        slot: int = 10,
+        binary: bool = False,
+        sequential: bool = False,
+    ) -> None:
+        """
+        Configures an arbitrary waveform cycle and saves it to the designated slot.
+        The data is scaled so that its peak magnitude maps to the full DAC range.
+        By default the upload, *SAV and *OPC? are chained into one message and the
+        call returns once the instrument confirms the save, raising RuntimeError
+        otherwise. With sequential=True the upload and *SAV are sent as separate
+        messages without the *OPC? handshake. With binary=True the samples are
+        sent as an IEEE-488.2 definite-length block of big-endian 16-bit integers
+        instead of ASCII values, also without the handshake
+        """
+        assert 1 <= len(data) <= 4096, f"data length {len(data)} out of range"
+        assert 10 <= slot <= 19, f"slot {slot} out of range"
+
+        if binary:
+            scaled = self._quantize(data)
+            with self._lock:
+                self._flush()
+                self.logger.debug(">>> DATA:DAC VOLATILE,0,<%d binary values>", scaled.size)
+                self._resource.write_binary_values(
+                    "DATA:DAC VOLATILE,0,", scaled, datatype="h", is_big_endian=True
+                )
+            self.save(slot)
             return
 
-        self.write(f"SOUR:FREQ:STAR {start}")
-        self.write(f"SOUR:FREQ:STOP {stop}")
-        self.write(f"SOUR:SWE:SPAC {spacing}")
-        self.write(f"SOUR:SWE:RATE {rate}")
-        self.write(f"SOUR:SWE:SOUR {source}")
+        payload = self._encode_csv(data)
+        if sequential:
+            self._write_bytes(b"DATA:DAC VOLATILE,0," + payload)
+            self.save(slot)
+        else:
+            response = self._query_bytes(
+                b"DATA:DAC VOLATILE,0," + payload
+                + b";:" + _PFX_SAV + str(slot).encode() + b";" + _CMD_OPC
+            )
+            if response != "1":
+                raise RuntimeError(f"Waveform upload not confirmed, *OPC? returned {response!r}")
+
+
+class AsyncAFG2125(AFG2125):
+    """
+    AFG2125 with callback-driven queries. Inside an async_session() the response
+    of query_async is read with viReadAsync and completed from the VISA I/O
+    completion callback instead of tying up a worker thread. Outside a session,
+    or on backends without asynchronous I/O, the worker thread is used
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._handler = None
+        self._user_handle = None
+        self._io_lock = threading.RLock()
+        self._pending: dict = {}
+        self._completed: dict = {}
+        self._abandoned: set = set()
+        self._query_lock: asyncio.Lock | None = None
 
-    def set_arb_data(self, data: list, slot: int = 10) -> None:
+    @contextlib.asynccontextmanager
+    async def async_session(self) -> AsyncIterator["AsyncAFG2125"]:
         """
-        Configures an arbitrary waveform cycle and saves it to the designated slot
+        Installs the I/O completion handler for the duration of the block
         """
-        assert len(data) >= 1 and len(data) <= 4096
-        assert slot in list(range(10, 20))
+        from pyvisa.constants import EventMechanism, EventType
+        from pyvisa.errors import VisaIOError
 
-        max_val = max(abs(x) for x in data)
-        if max_val == 0:
-            return [0.0] * len(data)  # Avoid division by zero
-        scale = 511.0 / max_val
-        data_str = ",".join([str(round(x * scale)) for x in data])
+        self._loop = asyncio.get_running_loop()
+        self._query_lock = asyncio.Lock()
+        handler = self._resource.wrap_handler(self._on_io_completion)
+        installed = False
+        try:
+            self._user_handle = self._resource.install_handler(
+                EventType.io_completion, handler
+            )
+            installed = True
+            self._resource.enable_event(EventType.io_completion, EventMechanism.handler)
+            self._handler = handler
+        except (NotImplementedError, VisaIOError):
+            self.logger.debug("I/O completion events unsupported, using a worker thread")
+            if installed:
+                self._resource.uninstall_handler(
+                    EventType.io_completion, handler, self._user_handle
+                )
+            self._handler = None
+            self._user_handle = None
+
+        try:
+            yield self
+        finally:
+            if self._handler is not None:
+                self._resource.disable_event(EventType.io_completion, EventMechanism.handler)
+                self._resource.uninstall_handler(
+                    EventType.io_completion, self._handler, self._user_handle
+                )
+            self._handler = None
+            self._user_handle = None
+            self._loop = None
+            self._query_lock = None
+
+    async def query_async(self, command: str) -> str:
+        """
+        Writes a command and awaits the response without blocking the event loop.
+        In an async_session() replies are read into a fixed 256 byte buffer, which
+        fits every query reply of this instrument
+        """
+        if self._handler is None:
+            return await super().query_async(command)
+
+        async with self._query_lock:
+            with self._lock:
+                self._flush()
+                self._log_sent(command)
+                self._resource.write(command)
+
+            future = self._loop.create_future()
+            with self._io_lock:
+                _, job_id, _ = self._resource.visalib.read_asynchronously(
+                    self._resource.session, _ASYNC_READ_SIZE
+                )
+                if job_id in self._completed:
+                    self._resolve(future, *self._completed.pop(job_id))
+                else:
+                    self._pending[job_id] = future
+            try:
+                data = await future
+            except asyncio.CancelledError:
+                # Abort the read, otherwise the next reply is consumed by this job
+                from pyvisa.errors import VisaIOError
+                with self._io_lock:
+                    running = self._pending.pop(job_id, None) is not None
+                    if running:
+                        self._abandoned.add(job_id)
+                # Outside the lock, the abort's completion callback needs it
+                if running:
+                    with contextlib.suppress(VisaIOError):
+                        self._resource.visalib.terminate(self._resource.session, 0, job_id)
+                raise
 
-        self.write(f"DATA:DAC VOLATILE,0,{data_str}")
-        self.save(slot)
+        response = data.decode(self._resource.encoding).strip()
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("<<< %s", response)
+        return response
+
+    async def write_async(self, command: str) -> None:
+        """
+        Awaitable version of write. Inside an async_session() it is ordered with
+        query_async on the same instrument
+        """
+        if self._handler is None:
+            return await super().write_async(command)
+        async with self._query_lock:
+            await super().write_async(command)
+
+    def _on_io_completion(self, resource: Resource, event, user_handle) -> None:
+        # Runs on a VISA thread, possibly before read_asynchronously has returned
+        result = (event.status, event.data)
+        with self._io_lock:
+            self._release_job_buffer(event.job_id)
+            if event.job_id in self._abandoned:
+                self._abandoned.discard(event.job_id)
+                return
+            future = self._pending.pop(event.job_id, None)
+            if future is None:
+                self._completed[event.job_id] = result
+                return
+            loop = self._loop
+        if loop is None:
+            return  # The session has already been closed
+        loop.call_soon_threadsafe(self._resolve, future, *result)
+
+    def _release_job_buffer(self, job_id) -> None:
+        # pyvisa's ctypes backend keeps every viReadAsync buffer in a list and never
+        # drops it, so remove finished jobs here to keep long sessions bounded
+        jobs = getattr(self._resource.visalib, "_async_read_jobs", None)
+        if jobs:
+            jobs[:] = [job for job in jobs if job[0].value != job_id]
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, status, data: bytes) -> None:
+        if future.done():
+            return
+        if status < 0:
+            from pyvisa.errors import VisaIOError
+            future.set_exception(VisaIOError(status))
+        else:
+            future.set_result(data)
@@ -0,0 +1,465 @@
+import asyncio
+import io
+import logging
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import gwinstek
+
+
+class FakeResource:
+    write_termination = "\n"
+    read_termination = "\n"
+    encoding = "ascii"
+    session = 1
+
+    def __init__(self):
+        self.sent = []
+        self.replies = {}
+        self.read_reply = "1"
+
+    def write(self, command):
+        self.sent.append(command)
+
+    def write_raw(self, command):
+        self.sent.append(command.decode().rstrip("\n"))
+
+    def write_binary_values(self, message, values, datatype="f", is_big_endian=False):
+        self.sent.append((message, list(values), datatype, is_big_endian))
+
+    def query(self, command):
+        self.sent.append(command)
+        return self.replies.get(command, "0") + "\n"
+
+    def read(self):
+        return self.read_reply + "\n"
+
+    def close(self):
+        pass
+
+
+class FakeResourceManager:
+    def __init__(self, resource=None):
+        self.resource = resource or FakeResource()
+
+    def open_resource(self, resource_name, **options):
+        return self.resource
+
+
+@pytest.fixture
+def afg():
+    return gwinstek.AFG2125("ASRL1::INSTR", FakeResourceManager())
+
+
+WAVEFORMS = {
+    "sine": np.sin(np.linspace(0, 2 * np.pi, 4096, endpoint=False)),
+    "float32": np.random.default_rng(0).normal(size=1000).astype(np.float32),
+    "zeros": np.zeros(16),
+    "halfway": np.array([511.0, 0.5, 1.5, 2.5, -0.5, -2.5, -511.0]),
+    "list": [0.25, -1.0, 0.5],
+}
+
+
+def _reference_quantize(data):
+    arr = np.asarray(data, dtype=np.float64)
+    max_val = np.abs(arr).max()
+    if max_val == 0:
+        return np.zeros(arr.shape, dtype=np.int16)
+    return np.rint(arr * (511.0 / max_val)).astype(np.int16)
+
+
+def _reference_csv(data):
+    buf = io.BytesIO()
+    np.savetxt(buf, _reference_quantize(data).reshape(1, -1), fmt="%d", delimiter=",")
+    return buf.getvalue().rstrip()
+
+
+@pytest.mark.parametrize("name", WAVEFORMS)
+def test_quantize_matches_reference(afg, name):
+    data = WAVEFORMS[name]
+    np.testing.assert_array_equal(afg._quantize(data), _reference_quantize(data))
+
+
+@pytest.fixture
+def numba_kernel(monkeypatch):
+    pytest.importorskip("numba")
+    monkeypatch.setenv("GWINSTEK_NUMBA", "1")
+    monkeypatch.setattr(gwinstek, "_scale_kernel", gwinstek._UNRESOLVED)
+    kernel = gwinstek._numba_kernel()
+    assert kernel is not None
+    return kernel
+
+
+def test_numba_kernel_is_opt_in(monkeypatch):
+    monkeypatch.delenv("GWINSTEK_NUMBA", raising=False)
+    monkeypatch.setattr(gwinstek, "_scale_kernel", gwinstek._UNRESOLVED)
+    assert gwinstek._numba_kernel() is None
+
+
+@pytest.mark.parametrize("name", WAVEFORMS)
+def test_numba_kernel_matches_numpy(afg, numba_kernel, name):
+    data = WAVEFORMS[name]
+    np.testing.assert_array_equal(afg._quantize(data), _reference_quantize(data))
+
+
+@pytest.mark.parametrize("name", WAVEFORMS)
+def test_native_encoder_matches_numpy(afg, name):
+    encode_arb = gwinstek._native_encoder()
+    if encode_arb is None:
+        pytest.skip("_gwinstek_native is not built")
+    data = WAVEFORMS[name]
+    assert encode_arb(data) == _reference_csv(data)
+
+
+NON_FINITE = {
+    "nan": np.array([1.0, np.nan, 0.5]),
+    "nan_first": np.array([np.nan, 1.0]),
+    "inf": np.array([1.0, -np.inf]),
+    "float32_nan": np.array([np.nan, 1.0], dtype=np.float32),
+}
+
+
+@pytest.mark.parametrize("name", NON_FINITE)
+def test_non_finite_data_is_rejected(afg, name):
+    with pytest.raises(ValueError):
+        afg.set_arb_data(NON_FINITE[name])
+    assert afg._resource.sent == []
+
+
+@pytest.mark.parametrize("name", NON_FINITE)
+def test_numba_kernel_rejects_non_finite(afg, numba_kernel, name):
+    with pytest.raises(ValueError):
+        afg.set_arb_data(NON_FINITE[name])
+    assert afg._resource.sent == []
+
+
+@pytest.mark.parametrize("name", NON_FINITE)
+def test_native_encoder_rejects_non_finite(name):
+    encode_arb = gwinstek._native_encoder()
+    if encode_arb is None:
+        pytest.skip("_gwinstek_native is not built")
+    with pytest.raises(ValueError):
+        encode_arb(NON_FINITE[name])
+
+
+def test_set_arb_data_binary_block(afg):
+    afg.set_arb_data(np.array([1.0, -0.5, 0.0]), slot=13, binary=True)
+    assert afg._resource.sent == [
+        ("DATA:DAC VOLATILE,0,", [511, -256, 0], "h", True),
+        "*SAV 13",
+    ]
+
+
+def test_batched_coalesces_writes(afg):
+    with afg.batched():
+        afg.set_frequency(1000)
+        afg.set_output("ON")
+        assert afg._resource.sent == []
+    assert afg._resource.sent == ["SOUR:FREQ 1000;:OUTP ON"]
+
+
+def test_nested_batches_flush_once(afg):
+    with afg.batched():
+        afg.set_output("ON")
+        with afg.batched():
+            afg.set_function("SIN")
+        assert afg._resource.sent == []
+    assert afg._resource.sent == ["OUTP ON;:SOUR:FUNC SIN"]
+
+
+def test_batched_query_flushes_first(afg):
+    with afg.batched():
+        afg.set_output("ON")
+        afg.get_output()
+    assert afg._resource.sent == ["OUTP ON", "OUTP?"]
+
+
+def test_batch_is_dropped_on_error(afg):
+    with pytest.raises(ValueError):
+        with afg.batched():
+            afg.set_output("ON")
+            raise ValueError
+    assert afg._resource.sent == []
+    assert afg._batch is None
+
+
+def test_long_commands_are_truncated_in_debug_log(afg, caplog):
+    with caplog.at_level(logging.DEBUG, logger="AFG2125"):
+        afg.set_arb_data(np.sin(np.linspace(0, 2 * np.pi, 4096, endpoint=False)))
+    message = caplog.records[0].getMessage()
+    assert message.endswith("bytes>")
+    assert len(message) < gwinstek._LOG_PAYLOAD_LIMIT + 40
+
+
+def test_nothing_is_logged_when_debug_is_off(afg, caplog):
+    with caplog.at_level(logging.INFO, logger="AFG2125"):
+        afg.set_output("ON")
+        afg.get_output()
+    assert caplog.records == []
+
+
+class FakeEvent:
+    def __init__(self, job_id, data, status=0):
+        self.job_id = job_id
+        self.data = data
+        self.status = status
+
+
+class FakeVisaLib:
+    def __init__(self, resource):
+        self.resource = resource
+        self.jobs = 0
+        self.terminated = []
+        self.hold = set()
+
+    def read_asynchronously(self, session, count):
+        self.jobs += 1
+        job_id = self.jobs
+        if job_id not in self.hold:
+            reply = (self.resource.sent[-1] + "-reply\n").encode()
+            threading.Timer(
+                0.01, self.resource.handler, (self.resource, FakeEvent(job_id, reply), None)
+            ).start()
+        return None, job_id, 0
+
+    def terminate(self, session, degree, job_id):
+        # Like a backend that runs the abort callback on its own thread and waits
+        self.terminated.append(job_id)
+        callback = threading.Thread(
+            target=self.resource.handler, args=(self.resource, FakeEvent(job_id, b"", -1), None)
+        )
+        callback.start()
+        callback.join(timeout=1)
+        assert not callback.is_alive(), "completion callback deadlocked"
+
+
+class FakeAsyncResource(FakeResource):
+    def __init__(self):
+        super().__init__()
+        self.visalib = FakeVisaLib(self)
+        self.handler = None
+
+    def wrap_handler(self, callable):
+        return callable
+
+    def install_handler(self, event_type, handler):
+        self.handler = handler
+        return 1
+
+    def enable_event(self, event_type, mechanism):
+        pass
+
+    def disable_event(self, event_type, mechanism):
+        pass
+
+    def uninstall_handler(self, event_type, handler, user_handle):
+        self.handler = None
+
+
+def test_async_session_queries():
+    pytest.importorskip("pyvisa")
+    resource = FakeAsyncResource()
+    afg = gwinstek.AsyncAFG2125("ASRL1::INSTR", FakeResourceManager(resource))
+
+    async def main():
+        async with afg.async_session():
+            return await asyncio.gather(afg.query_async("A?"), afg.query_async("B?"))
+
+    assert asyncio.run(main()) == ["A?-reply", "B?-reply"]
+    assert resource.handler is None
+
+
+def test_async_query_cancel_terminates_read():
+    pytest.importorskip("pyvisa")
+    resource = FakeAsyncResource()
+    resource.visalib.hold.add(1)
+    afg = gwinstek.AsyncAFG2125("ASRL1::INSTR", FakeResourceManager(resource))
+
+    async def main():
+        async with afg.async_session():
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(afg.query_async("SLOW?"), 0.05)
+            return await afg.query_async("B?")
+
+    assert asyncio.run(main()) == "B?-reply"
+    assert resource.visalib.terminated == [1]
+    assert afg._pending == {} and afg._abandoned == set()
+
+
+def test_async_session_keeps_writes_and_queries_ordered():
+    pytest.importorskip("pyvisa")
+    resource = FakeAsyncResource()
+    write = resource.write
+
+    def slow_write(command):
+        if command == "OUTP ON":
+            time.sleep(0.05)
+        write(command)
+
+    resource.write = slow_write
+    afg = gwinstek.AsyncAFG2125("ASRL1::INSTR", FakeResourceManager(resource))
+
+    async def main():
+        async with afg.async_session():
+            return await asyncio.gather(afg.write_async("OUTP ON"), afg.query_async("OUTP?"))
+
+    assert asyncio.run(main()) == [None, "OUTP?-reply"]
+    assert resource.sent == ["OUTP ON", "OUTP?"]
+    afg.close()
+
+
+def test_fixed_commands_are_terminated(afg):
+    sent = []
+    afg._resource.write_raw = sent.append
+    afg.reset()
+    afg.clear()
+    afg.save(11)
+    afg.recall(12)
+    assert sent == [b"*RST\n", b"*CLS\n", b"*SAV 11\n", b"*RCL 12\n"]
+
+
+@pytest.mark.parametrize("value, text", [
+    (1000, "1000"),
+    (0.1, "0.1"),
+    (1000000.123456, "1000000.123456"),
+    (np.float32(0.1), "0.1"),
+    (np.float64(2.5), "2.5"),
+    (np.int64(50), "50"),
+    ("MAX", "MAX"),
+])
+def test_numeric_setter_formatting(afg, value, text):
+    afg.set_frequency(value)
+    afg.set_duty_cycle(value)
+    assert afg._resource.sent == [f"SOUR:FREQ {text}", f"SOUR:SQU:DCYC {text}"]
+
+
+def test_set_arb_data_chains_save_and_opc(afg):
+    afg.set_arb_data([1.0, -0.5], slot=12)
+    assert afg._resource.sent == ["DATA:DAC VOLATILE,0,511,-256;:*SAV 12;*OPC?"]
+
+
+def test_set_arb_data_raises_when_not_confirmed(afg):
+    afg._resource.read_reply = "0"
+    with pytest.raises(RuntimeError):
+        afg.set_arb_data([1.0, -1.0])
+
+
+def test_set_arb_data_sequential(afg):
+    afg.set_arb_data([1.0, -1.0], slot=11, sequential=True)
+    assert afg._resource.sent == ["DATA:DAC VOLATILE,0,511,-511", "*SAV 11"]
+
+
+def test_pooled_calls_keep_instrument_order(afg):
+    async def main():
+        return await asyncio.gather(
+            afg.write_async("OUTP ON"), afg.query_async("OUTP?"), afg.get_frequency_async()
+        )
+
+    afg._resource.replies.update({"OUTP?": "1", "SOUR:FREQ?": "1000"})
+    assert asyncio.run(main()) == [None, "1", 1000.0]
+    assert afg._resource.sent == ["OUTP ON", "OUTP?", "SOUR:FREQ?"]
+    afg.close()
+
+
+def test_sync_call_waits_for_pooled_transaction(afg):
+    query = afg._resource.query
+
+    def slow_query(command):
+        reply = query(command)
+        time.sleep(0.05)
+        afg._resource.sent.append("done")
+        return reply
+
+    afg._resource.query = slow_query
+
+    async def main():
+        pending = asyncio.ensure_future(afg.query_async("OUTP?"))
+        await asyncio.sleep(0.01)
+        afg.write("OUTP OFF")
+        return await pending
+
+    asyncio.run(main())
+    assert afg._resource.sent == ["OUTP?", "done", "OUTP OFF"]
+    afg.close()
+
+
+def test_discarded_batch_invalidates_cache(afg):
+    afg._resource.replies["SOUR:FREQ?"] = "1000"
+    with pytest.raises(ValueError):
+        with afg.batched():
+            afg.set_frequency(2e6 + 0.5)
+            raise ValueError
+    assert afg.get_frequency() == 1000.0
+    assert afg._resource.sent == ["SOUR:FREQ?"]
+
+
+def test_setter_writes_through_cache(afg):
+    afg.set_amplitude(2.5)
+    assert afg.get_amplitude() == 2.5
+    afg.set_amplitude("MAX")
+    afg._resource.replies["SOUR:AMPL?"] = "10"
+    assert afg.get_amplitude() == 10.0
+    assert afg._resource.sent == ["SOUR:AMPL 2.5", "SOUR:AMPL MAX", "SOUR:AMPL?"]
+
+
+def test_reset_invalidates_cache(afg):
+    afg.set_offset(1.0)
+    afg.reset()
+    afg._resource.replies["SOUR:DCO?"] = "0"
+    assert afg.get_offset() == 0.0
+
+
+def test_async_getter_uses_cache(afg):
+    afg.set_frequency(1000)
+    assert asyncio.run(afg.get_frequency_async()) == 1000.0
+    assert afg._resource.sent == ["SOUR:FREQ 1000"]
+
+
+def test_default_resource_manager_is_shared(monkeypatch):
+    pyvisa = pytest.importorskip("pyvisa")
+    monkeypatch.setattr(pyvisa, "ResourceManager", FakeResourceManager)
+    monkeypatch.setattr(gwinstek, "_DEFAULT_RM", None)
+    first = gwinstek.AFG2125("ASRL1::INSTR")
+    second = gwinstek.AFG2125("ASRL2::INSTR")
+    assert first._rm is second._rm
+    assert isinstance(first._rm, FakeResourceManager)
+
+
+def test_injected_resource_manager_is_used(monkeypatch):
+    monkeypatch.setattr(gwinstek, "_DEFAULT_RM", None)
+    rm = FakeResourceManager()
+    assert gwinstek.AFG2125("ASRL1::INSTR", rm)._rm is rm
+    assert gwinstek._DEFAULT_RM is None
+
+
+class RecordingResourceManager(FakeResourceManager):
+    def open_resource(self, resource_name, **options):
+        self.options = options
+        return self.resource
+
+
+@pytest.mark.parametrize("resource_name, baud_rate, expected", [
+    ("ASRL9::INSTR", None, None),
+    ("ASRL9::INSTR", 115200, 115200),
+    ("USB0::0x2184::0x001C::INSTR", 115200, None),
+])
+def test_open_resource_options(resource_name, baud_rate, expected):
+    rm = RecordingResourceManager()
+    gwinstek.AFG2125(resource_name, rm, timeout=2000, baud_rate=baud_rate)
+    assert rm.options.pop("baud_rate", None) == expected
+    assert rm.options == {
+        "write_termination": "\n",
+        "read_termination": "\n",
+        "chunk_size": 1 << 16,
+        "timeout": 2000,
+    }
+
+
+def test_async_instrument_forwards_constructor_arguments():
+    rm = RecordingResourceManager()
+    gwinstek.AsyncAFG2125("ASRL9::INSTR", rm, timeout=100, baud_rate=9600)
+    assert rm.options["timeout"] == 100
+    assert rm.options["baud_rate"] == 9600